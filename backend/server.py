@@ -1,24 +1,37 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
+import logging.handlers
+import queue
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
 from datetime import datetime, timedelta
 import asyncio
+import itertools
+import orjson
 import json
-import aiofiles
-import boto3
-from botocore.client import Config
+import re
+import threading
+from collections import OrderedDict
+import aioboto3
+import filetype
+from aiobotocore.config import AioConfig
+from boto3.s3.transfer import TransferConfig
+from contextlib import AsyncExitStack, asynccontextmanager
+from aiolimiter import AsyncLimiter
 from botocore.exceptions import ClientError
-from emergentintegrations.llm.chat import LlmChat, UserMessage, FileContentWithMimeType
-import google.generativeai as genai
+from google import genai
+from google.genai import errors as genai_errors
 import tempfile
+import shutil
 import time
 import asyncio
 from typing import Optional, Dict, Any
@@ -28,30 +41,87 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    # A small pool suits this workload; override per deployment if needed
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', 20)),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', 5)),  # warm connections skip the handshake
+    maxIdleTimeMS=60_000,
+    serverSelectionTimeoutMS=5000,
+    retryWrites=True
+)
 db = client[os.environ['DB_NAME']]
 
 # Cloudflare R2 setup
-s3_client = boto3.client(
-    's3',
-    endpoint_url=os.environ.get('CLOUDFLARE_API_ENDPOINT'),
+R2_BUCKET_NAME = "video-generation-bucket"
+R2_PART_SIZE = 8 * 1024 * 1024  # R2 multipart parts (all but the last) must be equal and >= 5MB
+# Files below one part go up in a single PUT, larger ones in parallel parts
+R2_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=R2_PART_SIZE,
+    multipart_chunksize=R2_PART_SIZE,
+    max_concurrency=10
+)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+PRESIGNED_URL_EXPIRY_SECONDS = 3600
+# Outlives the presigned URL, so a client can still call /analyze after a slow upload
+UPLOAD_SESSION_TTL_SECONDS = 2 * PRESIGNED_URL_EXPIRY_SECONDS
+
+# aioboto3 runs R2 requests on aiohttp so uploads never block the event loop
+r2_session = aioboto3.Session(
     aws_access_key_id=os.environ.get('CLOUDFLARE_ACCESS_KEY'),
-    aws_secret_access_key=os.environ.get('CLOUDFLARE_SECRET_KEY'),
-    config=Config(signature_version='s3v4')
+    aws_secret_access_key=os.environ.get('CLOUDFLARE_SECRET_KEY')
 )
 
+def r2_client():
+    """Shared async S3 client for Cloudflare R2, opened at startup"""
+    return app.state.r2
+
 # Create the main app
-app = FastAPI(title="Video Generation Platform", version="1.0.0")
+app = FastAPI(
+    title="Video Generation Platform",
+    version="1.0.0",
+    default_response_class=ORJSONResponse
+)
 api_router = APIRouter(prefix="/api")
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging; records are queued and written to stderr on a background thread
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(log_queue)])
+log_listener.start()
 logger = logging.getLogger(__name__)
 
+# ID generation
+UUID_POOL_SIZE = 1024
+
+class UUIDPool:
+    """Thread-safe uuid4 source that draws random bytes in batches instead of one syscall per ID"""
+    
+    def __init__(self, size: int):
+        self.size = size
+        self._buffer = b""
+        self._position = 0
+        self._lock = threading.Lock()
+    
+    def next(self) -> str:
+        with self._lock:
+            if self._position >= len(self._buffer):
+                self._buffer = os.urandom(16 * self.size)
+                self._position = 0
+            chunk = self._buffer[self._position:self._position + 16]
+            self._position += 16
+        # version=4 sets the version and variant bits, as uuid.uuid4() does
+        return str(uuid.UUID(bytes=chunk, version=4))
+
+uuid_pool = UUIDPool(UUID_POOL_SIZE)
+
+def next_uuid() -> str:
+    return uuid_pool.next()
+
 # Models
 class VideoUploadRequest(BaseModel):
-    user_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    session_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str = Field(default_factory=next_uuid)
+    session_id: str = Field(default_factory=next_uuid)
 
 class VideoAnalysisResponse(BaseModel):
     id: str
@@ -69,6 +139,20 @@ class PlanModificationRequest(BaseModel):
     session_id: str
     modification_request: str
 
+class PresignUploadRequest(BaseModel):
+    user_id: str
+    video_content_type: str
+    character_image_content_type: Optional[str] = None
+    audio_content_type: Optional[str] = None
+
+class PresignUploadResponse(BaseModel):
+    session_id: str
+    upload_urls: Dict[str, str]
+    expires_in: int
+
+class AnalyzeUploadRequest(BaseModel):
+    session_id: str
+
 class VideoGenerationRequest(BaseModel):
     session_id: str
     approved_plan: str
@@ -81,11 +165,27 @@ class VideoGenerationStatus(BaseModel):
     error: Optional[str] = None
 
 class User(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=next_uuid)
     email: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
     last_login: datetime = Field(default_factory=datetime.utcnow)
 
+GENERATION_FINAL_STATUSES = ("completed", "failed")
+
+# The fields build_generation_status reads; status reads skip the stored approved plan
+GENERATION_STATUS_PROJECTION = {"session_id": 1, "status": 1, "progress": 1, "estimated_time_remaining": 1, "error": 1}
+
+def build_generation_status(generation: Dict[str, Any]) -> VideoGenerationStatus:
+    """Build the public status view of a video_generations record"""
+    # Our own stored values, so skip validation on this per-tick path
+    return VideoGenerationStatus.model_construct(
+        session_id=generation["session_id"],
+        status=generation["status"],
+        progress=generation.get("progress", 0),
+        estimated_time_remaining=generation.get("estimated_time_remaining"),
+        error=generation.get("error")
+    )
+
 # Gemini API Keys rotation
 GEMINI_API_KEYS = [
     os.environ.get('GEMINI_API_KEY_1'),
@@ -93,56 +193,374 @@ GEMINI_API_KEYS = [
     os.environ.get('GEMINI_API_KEY_3')
 ]
 
-current_gemini_key_index = 0
+GEMINI_KEY_COOLDOWN_SECONDS = 60
+GEMINI_KEY_MAX_COOLDOWN_SECONDS = 600
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether a Gemini error means the key hit its quota (HTTP 429)"""
+    message = str(error).lower()
+    if isinstance(error, genai_errors.APIError):
+        return error.code == 429
+    return "429" in message or "quota" in message
+
+def retry_delay(error: Exception) -> Optional[float]:
+    """Server-suggested wait in seconds from a Gemini 429 (its RetryInfo detail), if any"""
+    details = getattr(error, "details", None)
+    if not isinstance(details, dict):
+        return None
+    for detail in details.get("error", {}).get("details", []):
+        if detail.get("@type", "").endswith("RetryInfo") and "retryDelay" in detail:
+            try:
+                return float(detail["retryDelay"].rstrip("s"))
+            except ValueError:
+                return None
+    return None
+
+class GeminiKeyRotator:
+    """Thread-safe picker of the least-loaded Gemini key, skipping keys cooling down after a 429"""
+    
+    def __init__(self, keys: List[Optional[str]]):
+        self.keys = [key for key in keys if key]
+        self.available_at = {key: 0.0 for key in self.keys}
+        self.consecutive_failures = {key: 0 for key in self.keys}
+        self.inflight = {key: 0 for key in self.keys}
+        self._cycle = itertools.cycle(range(len(self.keys)))
+        self._lock = threading.Lock()
+    
+    def cooldown(self, key: str) -> float:
+        # Back off exponentially while a key keeps getting throttled
+        failures = max(self.consecutive_failures[key], 1)
+        return min(GEMINI_KEY_COOLDOWN_SECONDS * 2 ** (failures - 1), GEMINI_KEY_MAX_COOLDOWN_SECONDS)
+    
+    def next_key(self) -> str:
+        if not self.keys:
+            raise Exception("No Gemini API keys configured")
+        
+        with self._lock:
+            now = time.monotonic()
+            # Rotate the scan start so ties on load still spread across keys
+            start = next(self._cycle)
+            ordered = self.keys[start:] + self.keys[:start]
+            available = [key for key in ordered if now >= self.available_at[key]]
+            if available:
+                return min(available, key=self.inflight.get)
+            
+            # Every key is cooling down; use the one that recovers first
+            return min(self.keys, key=self.available_at.get)
+    
+    def acquire(self, key: str):
+        with self._lock:
+            self.inflight[key] += 1
+    
+    def release(self, key: str):
+        with self._lock:
+            self.inflight[key] -= 1
+    
+    def mark_success(self, key: Optional[str]):
+        if key in self.consecutive_failures:
+            with self._lock:
+                self.consecutive_failures[key] = 0
+    
+    def mark_failure(self, key: Optional[str], error: Exception):
+        if key in self.available_at and is_rate_limit_error(error):
+            with self._lock:
+                self.consecutive_failures[key] += 1
+                # Prefer the wait Gemini asks for over our own backoff guess
+                delay = retry_delay(error)
+                if delay is None:
+                    delay = self.cooldown(key)
+                self.available_at[key] = time.monotonic() + delay
+
+gemini_keys = GeminiKeyRotator(GEMINI_API_KEYS)
+
+# One client per key: each carries its own credentials and connection pool, so
+# concurrent requests never race on a process-wide genai.configure()
+gemini_clients = {key: genai.Client(api_key=key) for key in gemini_keys.keys}
 
 def get_next_gemini_key():
-    global current_gemini_key_index
-    key = GEMINI_API_KEYS[current_gemini_key_index]
-    current_gemini_key_index = (current_gemini_key_index + 1) % len(GEMINI_API_KEYS)
-    return key
+    return gemini_keys.next_key()
+
+# Per-key request budget, so bursts queue locally instead of earning 429s
+GEMINI_REQUESTS_PER_MINUTE = int(os.environ.get('GEMINI_REQUESTS_PER_MINUTE', 15))
+# Two calls in flight per key; beyond that requests queue here rather than at Gemini
+GEMINI_MAX_CONCURRENCY = max(2 * len(gemini_keys.keys), 1)
+# Whole analyses in flight (file uploads, polling and fallbacks included); sized on its
+# own so it bounds per-analysis work without shadowing the adaptive per-call window
+GEMINI_MAX_ANALYSES = int(os.environ.get('GEMINI_MAX_ANALYSES', max(len(gemini_keys.keys), 1)))
+
+gemini_limiters = {key: AsyncLimiter(GEMINI_REQUESTS_PER_MINUTE, 60) for key in gemini_keys.keys}
+
+class AdaptiveConcurrency:
+    """AIMD cap on in-flight Gemini calls: halved on a 429, grown by one per window of successes"""
+    
+    def __init__(self, maximum: int):
+        self.limit = float(maximum)
+        self.maximum = maximum
+        self.inflight = 0
+        self._condition = asyncio.Condition()
+    
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.inflight -= 1
+            if exc is None:
+                self.limit = min(self.limit + 1 / self.limit, self.maximum)
+            elif is_rate_limit_error(exc):
+                self.limit = max(self.limit / 2, 1.0)
+            self._condition.notify_all()
+
+gemini_concurrency = AdaptiveConcurrency(GEMINI_MAX_CONCURRENCY)
+
+@asynccontextmanager
+async def gemini_slot(key: str):
+    """Wait for a concurrency slot and the key's rate budget before calling Gemini"""
+    gemini_keys.acquire(key)
+    try:
+        async with gemini_concurrency, gemini_limiters[key]:
+            yield
+    finally:
+        gemini_keys.release(key)
 
 # File upload utilities
+MAX_VIDEO_BYTES = 200 * 1024 * 1024
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+MAX_AUDIO_BYTES = 50 * 1024 * 1024
+UPLOAD_SNIFF_BYTES = 261  # enough header bytes for filetype to match any signature
+
+async def validate_upload(file: UploadFile, media_type: str, max_bytes: int):
+    """Reject an upload by declared type, size and magic bytes"""
+    if not file.content_type or not file.content_type.startswith(f"{media_type}/"):
+        raise HTTPException(status_code=400, detail=f"Invalid {media_type} file type")
+    
+    # Starlette records the spooled size, so oversized bodies are refused before we copy them anywhere
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{media_type.capitalize()} file exceeds {max_bytes // (1024 * 1024)}MB limit"
+        )
+    
+    # Only a recognised signature of another kind is rejected; unknown headers still
+    # get a chance at analysis through the text-only fallback
+    head = await file.read(UPLOAD_SNIFF_BYTES)
+    await file.seek(0)
+    kind = filetype.guess(head)
+    if kind and not kind.mime.startswith(f"{media_type}/"):
+        raise HTTPException(status_code=400, detail=f"Invalid {media_type} file type")
+
 async def save_uploaded_file(file: UploadFile, filename: str) -> str:
     """Save uploaded file to temporary directory and return path"""
     temp_dir = Path(tempfile.gettempdir()) / "video_uploads"
     temp_dir.mkdir(exist_ok=True)
     
     file_path = temp_dir / filename
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    await asyncio.to_thread(copy_upload_to_disk, file.file, file_path)
+    
+    return str(file_path)
+
+def copy_upload_to_disk(source, file_path: Path):
+    """Copy an upload's spooled file to disk in chunks (runs in a worker thread)"""
+    source.seek(0)
+    with open(file_path, 'wb') as f:
+        shutil.copyfileobj(source, f, UPLOAD_CHUNK_SIZE)
+
+async def ensure_bucket():
+    """Create the R2 bucket if it doesn't exist"""
+    s3 = r2_client()
+    try:
+        await s3.head_bucket(Bucket=R2_BUCKET_NAME)
+    except ClientError:
+        await s3.create_bucket(Bucket=R2_BUCKET_NAME)
+    app.state.bucket_ready = True
+
+bucket_check_lock = asyncio.Lock()
+
+async def require_bucket():
+    """Fail fast with a clear error while the startup bucket check hasn't succeeded"""
+    if app.state.bucket_ready:
+        return
+    # Startup may have hit a transient outage; check again (once for concurrent callers)
+    try:
+        async with bucket_check_lock:
+            if not app.state.bucket_ready:
+                await ensure_bucket()
+    except Exception as e:
+        logger.error(f"R2 bucket unavailable: {str(e)}")
+        raise HTTPException(status_code=503, detail="Storage bucket unavailable")
+
+async def remove_temp_files(file_paths: List[str]):
+    """Delete temporary files off the event loop, all at once"""
+    await asyncio.gather(*[
+        asyncio.to_thread(Path(path).unlink, missing_ok=True) for path in file_paths
+    ])
+
+def get_r2_url(bucket_key: str) -> str:
+    """Build the public R2 URL for an object key"""
+    return f"{os.environ.get('CLOUDFLARE_API_ENDPOINT')}/{R2_BUCKET_NAME}/{bucket_key}"
+
+def upload_targets(session_id: str) -> Dict[str, Tuple[str, str]]:
+    """Local filename and R2 key for each file of an upload session"""
+    return {
+        "video": (f"{session_id}_sample.mp4", f"samples/{session_id}_sample.mp4"),
+        "character_image": (f"{session_id}_character.jpg", f"characters/{session_id}_character.jpg"),
+        "audio": (f"{session_id}_audio.mp3", f"audio/{session_id}_audio.mp3"),
+    }
+
+async def presign_r2_put(bucket_key: str, content_type: str) -> str:
+    """Presigned PUT URL the client uses to upload straight to R2"""
+    # The URL doesn't cap the object's size: MAX_*_BYTES are only enforced later by
+    # download_from_r2's HEAD check in /analyze, and oversized objects stay in the bucket
+    s3 = r2_client()
+    return await s3.generate_presigned_url(
+        "put_object",
+        Params={"Bucket": R2_BUCKET_NAME, "Key": bucket_key, "ContentType": content_type},
+        ExpiresIn=PRESIGNED_URL_EXPIRY_SECONDS
+    )
+
+async def download_from_r2(bucket_key: str, filename: str, media_type: str, max_bytes: int) -> str:
+    """Download a client-uploaded R2 object to the temporary directory and return path"""
+    temp_dir = Path(tempfile.gettempdir()) / "video_uploads"
+    temp_dir.mkdir(exist_ok=True)
+    
+    file_path = temp_dir / filename
+    s3 = r2_client()
+    try:
+        head = await s3.head_object(Bucket=R2_BUCKET_NAME, Key=bucket_key)
+    except ClientError:
+        raise HTTPException(status_code=400, detail=f"{media_type.capitalize()} file was not uploaded")
+    if head["ContentLength"] > max_bytes:
+        raise HTTPException(status_code=413, detail=f"{media_type.capitalize()} file exceeds {max_bytes // (1024 * 1024)}MB limit")
+    await s3.download_file(R2_BUCKET_NAME, bucket_key, str(file_path), Config=R2_TRANSFER_CONFIG)
     
     return str(file_path)
 
 async def upload_to_r2(file_path: str, bucket_key: str) -> str:
     """Upload file to Cloudflare R2 and return public URL"""
+    await require_bucket()
     try:
-        bucket_name = "video-generation-bucket"
-        
-        # Create bucket if it doesn't exist
-        try:
-            s3_client.head_bucket(Bucket=bucket_name)
-        except ClientError:
-            s3_client.create_bucket(Bucket=bucket_name)
-        
         # Upload file
-        s3_client.upload_file(file_path, bucket_name, bucket_key)
+        s3 = r2_client()
+        await s3.upload_file(file_path, R2_BUCKET_NAME, bucket_key, Config=R2_TRANSFER_CONFIG)
         
-        # Generate public URL
-        url = f"{os.environ.get('CLOUDFLARE_API_ENDPOINT')}/{bucket_name}/{bucket_key}"
-        return url
+        return get_r2_url(bucket_key)
         
     except Exception as e:
         logger.error(f"Failed to upload to R2: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+async def stream_to_r2(file: UploadFile, bucket_key: str) -> str:
+    """Stream an uploaded file to Cloudflare R2 and return public URL"""
+    try:
+        # Reads the spooled upload directly; large files go up in concurrent parts
+        await file.seek(0)
+        s3 = r2_client()
+        await s3.upload_fileobj(file.file, R2_BUCKET_NAME, bucket_key, Config=R2_TRANSFER_CONFIG)
+        
+        return get_r2_url(bucket_key)
+        
+    except Exception as e:
+        logger.error(f"Failed to stream upload to R2: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+VIDEO_ANALYSIS_PROMPT = """Please analyze this video in extreme detail. Include:
+        1. Complete visual analysis (scenes, objects, people, actions, camera work)
+        2. Audio analysis (speech, music, sound effects, mood)
+        3. Narrative structure and flow
+        4. Technical specifications
+        5. Overall style and theme
+        
+        Then create a comprehensive plan for generating a similar video with:
+        - Same style and aesthetic approach
+        - Similar narrative structure
+        - Same technical specifications (9:16 aspect ratio, under 60 seconds)
+        - Different content to avoid copying
+        - Specific shot-by-shot breakdown
+        - Audio requirements
+        - Character requirements if applicable
+        
+        Format your response as JSON with 'analysis' and 'plan' fields."""
+
+# Structured output so Gemini always returns parseable {"analysis", "plan"} JSON
+VIDEO_ANALYST_INSTRUCTION = """You are an expert video analyst. Analyze the provided video in extreme detail including:
+                1. Visual content: scenes, objects, people, actions, movements, colors, lighting
+                2. Audio content: speech, music, sound effects, tone, mood
+                3. Narrative structure: beginning, middle, end, story progression
+                4. Style and aesthetics: camera angles, transitions, effects, filters
+                5. Technical aspects: resolution, frame rate, duration, aspect ratio
+                6. Overall theme and message
+                
+                Then create a detailed plan for generating a similar video with the same style, theme, and structure but with different content to avoid direct copying."""
+
+ANALYSIS_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "OBJECT",
+        "properties": {
+            "analysis": {"type": "STRING"},
+            "plan": {"type": "STRING"}
+        },
+        "required": ["analysis", "plan"]
+    }
+}
+
+# Gemini file uploads, reused across the official library's retry attempts
+GEMINI_FILE_CACHE_SIZE = 64
+GEMINI_FILE_POLL_BASE_SECONDS = 0.25
+GEMINI_FILE_POLL_MAX_SECONDS = 4.0
+gemini_file_cache: "OrderedDict[Tuple[str, str, int, int], Any]" = OrderedDict()
+
+async def upload_gemini_file(gemini_client: genai.Client, file_path: str):
+    """Upload a file to Gemini and wait until it is ACTIVE"""
+    logger.debug(f"Uploading file to Gemini: {file_path}")
+    file = await gemini_client.aio.files.upload(file=file_path)
+    
+    # Poll with exponential backoff
+    delay = GEMINI_FILE_POLL_BASE_SECONDS
+    while file.state.name == "PROCESSING":
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, GEMINI_FILE_POLL_MAX_SECONDS)
+        file = await gemini_client.aio.files.get(name=file.name)
+    
+    if file.state.name != "ACTIVE":
+        raise Exception(f"File processing failed: {file.name} - State: {file.state.name}")
+    return file
+
+async def ensure_gemini_files(gemini_key: str, file_paths: List[str]) -> List[Any]:
+    """Upload files to Gemini under the given key and wait until they are ACTIVE"""
+    files = {}
+    pending = []
+    stats = await asyncio.gather(*[asyncio.to_thread(os.stat, file_path) for file_path in file_paths])
+    for file_path, stat in zip(file_paths, stats):
+        # Uploaded files belong to the key's project, so they are cached per key
+        cache_key = (gemini_key, file_path, stat.st_mtime_ns, stat.st_size)
+        if cache_key in gemini_file_cache:
+            gemini_file_cache.move_to_end(cache_key)
+            files[file_path] = gemini_file_cache[cache_key]
+            continue
+        pending.append((cache_key, file_path))
+    
+    # Uploads and processing are independent per file, so run them together
+    gemini_client = gemini_clients[gemini_key]
+    active_files = await asyncio.gather(*[
+        upload_gemini_file(gemini_client, file_path) for _, file_path in pending
+    ])
+    for (cache_key, file_path), file in zip(pending, active_files):
+        gemini_file_cache[cache_key] = file
+        if len(gemini_file_cache) > GEMINI_FILE_CACHE_SIZE:
+            gemini_file_cache.popitem(last=False)
+        files[file_path] = file
+    
+    return [files[file_path] for file_path in file_paths]
+
 # Text-based video analysis for fallback
 async def analyze_video_text_only(video_path: str, character_image_path: Optional[str] = None, audio_path: Optional[str] = None) -> Dict[str, Any]:
     """Analyze video using text-based prompts when file upload fails"""
+    gemini_key = None
     try:
         gemini_key = get_next_gemini_key()
-        genai.configure(api_key=gemini_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
         
         # Create a detailed prompt based on file information
         file_info = f"Video file: {video_path}"
@@ -178,274 +596,169 @@ async def analyze_video_text_only(video_path: str, character_image_path: Optiona
         
         Format your response as JSON with 'analysis' and 'plan' fields."""
         
-        response = model.generate_content(prompt)
+        async with gemini_slot(gemini_key):
+            response = await gemini_clients[gemini_key].aio.models.generate_content(
+                model='gemini-2.5-flash',
+                contents=prompt,
+                config=ANALYSIS_GENERATION_CONFIG
+            )
+        gemini_keys.mark_success(gemini_key)
         
-        # Parse response
-        try:
-            result = json.loads(response.text)
-            return result
-        except json.JSONDecodeError:
-            # If not JSON, create structured response
-            return {
-                "analysis": f"Video Analysis Framework:\n{response.text[:len(response.text)//2]}",
-                "plan": f"Video Generation Plan:\n{response.text[len(response.text)//2:]}"
-            }
+        return orjson.loads(response.text)
             
     except Exception as e:
+        gemini_keys.mark_failure(gemini_key, e)
         logger.error(f"Text-only Gemini analysis failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Video analysis failed: {str(e)}")
 
-# Alternative Video analysis with Official Google Generative AI library
+# Alternative Video analysis with the official Google Gen AI SDK
 async def analyze_video_with_official_gemini(video_path: str, character_image_path: Optional[str] = None, audio_path: Optional[str] = None) -> Dict[str, Any]:
-    """Analyze video using official Google Generative AI library"""
+    """Analyze video using the official Google Gen AI SDK"""
+    file_paths = [path for path in (video_path, character_image_path, audio_path) if path]
+    gemini_key = None
     try:
         gemini_key = get_next_gemini_key()
         
-        # Configure the Google Generative AI client
-        genai.configure(api_key=gemini_key)
-        
-        # Choose the model
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        files_to_upload = []
-        
-        # Upload video file
-        print(f"Uploading video file: {video_path}")
-        video_file = genai.upload_file(path=video_path)
-        files_to_upload.append(video_file)
-        
-        # Upload character image if provided
-        if character_image_path:
-            print(f"Uploading character image: {character_image_path}")
-            image_file = genai.upload_file(path=character_image_path)
-            files_to_upload.append(image_file)
-        
-        # Upload audio file if provided
-        if audio_path:
-            print(f"Uploading audio file: {audio_path}")
-            audio_file = genai.upload_file(path=audio_path)
-            files_to_upload.append(audio_file)
-        
-        # Wait for files to be processed
-        for file in files_to_upload:
-            while file.state.name == "PROCESSING":
-                print(f"Processing file: {file.name}")
-                await asyncio.sleep(2)
-                file = genai.get_file(file.name)
-            
-            if file.state.name != "ACTIVE":
-                raise Exception(f"File processing failed: {file.name} - State: {file.state.name}")
-        
-        # Create the prompt
-        prompt = """Please analyze this video in extreme detail. Include:
-        1. Complete visual analysis (scenes, objects, people, actions, camera work)
-        2. Audio analysis (speech, music, sound effects, mood)
-        3. Narrative structure and flow
-        4. Technical specifications
-        5. Overall style and theme
-        
-        Then create a comprehensive plan for generating a similar video with:
-        - Same style and aesthetic approach
-        - Similar narrative structure
-        - Same technical specifications (9:16 aspect ratio, under 60 seconds)
-        - Different content to avoid copying
-        - Specific shot-by-shot breakdown
-        - Audio requirements
-        - Character requirements if applicable
-        
-        Format your response as JSON with 'analysis' and 'plan' fields."""
+        # Upload video, character image and audio files
+        files_to_upload = await ensure_gemini_files(gemini_key, file_paths)
         
         # Generate content
-        response = model.generate_content([prompt] + files_to_upload)
+        async with gemini_slot(gemini_key):
+            response = await gemini_clients[gemini_key].aio.models.generate_content(
+                model='gemini-2.5-flash',
+                contents=[VIDEO_ANALYSIS_PROMPT] + files_to_upload,
+                config=ANALYSIS_GENERATION_CONFIG
+            )
+        gemini_keys.mark_success(gemini_key)
         
-        # Parse response
-        try:
-            # Try to parse as JSON first
-            import json
-            result = json.loads(response.text)
-            return result
-        except json.JSONDecodeError:
-            # If not JSON, create structured response
-            return {
-                "analysis": response.text[:len(response.text)//2],
-                "plan": response.text[len(response.text)//2:]
-            }
+        return orjson.loads(response.text)
             
     except Exception as e:
+        gemini_keys.mark_failure(gemini_key, e)
         logger.error(f"Official Gemini analysis failed: {str(e)}")
-        # Try next API key
-        gemini_key = get_next_gemini_key()
-        
-        # Retry with different model
+        # Retry with a different model. Files uploaded under this key are reused,
+        # so only move to the next key when this one is throttled.
         try:
-            genai.configure(api_key=gemini_key)
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            
-            # Re-upload files for retry
-            files_to_upload = []
-            video_file = genai.upload_file(path=video_path)
-            files_to_upload.append(video_file)
+            if gemini_key is None or is_rate_limit_error(e):
+                gemini_key = get_next_gemini_key()
             
-            if character_image_path:
-                image_file = genai.upload_file(path=character_image_path)
-                files_to_upload.append(image_file)
-            
-            if audio_path:
-                audio_file = genai.upload_file(path=audio_path)
-                files_to_upload.append(audio_file)
-            
-            # Wait for processing
-            for file in files_to_upload:
-                while file.state.name == "PROCESSING":
-                    await asyncio.sleep(2)
-                    file = genai.get_file(file.name)
-                
-                if file.state.name != "ACTIVE":
-                    raise Exception(f"File processing failed: {file.name}")
+            files_to_upload = await ensure_gemini_files(gemini_key, file_paths)
             
             # Generate content with retry
-            response = model.generate_content([prompt] + files_to_upload)
+            async with gemini_slot(gemini_key):
+                response = await gemini_clients[gemini_key].aio.models.generate_content(
+                    model='gemini-1.5-flash',
+                    contents=[VIDEO_ANALYSIS_PROMPT] + files_to_upload,
+                    config=ANALYSIS_GENERATION_CONFIG
+                )
+            gemini_keys.mark_success(gemini_key)
             
-            try:
-                result = json.loads(response.text)
-                return result
-            except json.JSONDecodeError:
-                return {
-                    "analysis": response.text[:len(response.text)//2],
-                    "plan": response.text[len(response.text)//2:]
-                }
+            return orjson.loads(response.text)
                 
         except Exception as retry_e:
+            gemini_keys.mark_failure(gemini_key, retry_e)
             logger.error(f"Retry with official Gemini also failed: {str(retry_e)}")
             raise HTTPException(status_code=500, detail=f"Video analysis failed with both approaches: {str(e)} | Retry: {str(retry_e)}")
 
+ANALYSIS_JSON_START = re.compile(r'\{\s*"(?:analysis|plan)"')
+
+def is_analysis_result(result: Any) -> bool:
+    """Whether a decoded JSON value looks like an analysis/plan object"""
+    return isinstance(result, dict) and ("analysis" in result or "plan" in result)
+
+def extract_analysis_json(text: str) -> Dict[str, Any]:
+    """Pull the analysis/plan object out of a free-form Gemini reply"""
+    try:
+        result = orjson.loads(text)
+        if is_analysis_result(result):
+            return result
+    except orjson.JSONDecodeError:
+        pass
+    
+    # Replies often wrap the object in prose or a ```json fence; decode from where
+    # an analysis/plan object visibly starts, and only then from the first brace
+    decoder = json.JSONDecoder()
+    starts = [match.start() for match in ANALYSIS_JSON_START.finditer(text)] + [text.find("{")]
+    for start in starts:
+        if start == -1:
+            continue
+        try:
+            result, _ = decoder.raw_decode(text, start)
+        except ValueError:
+            continue
+        if is_analysis_result(result):
+            return result
+    
+    # No usable JSON: keep the whole reply as the analysis rather than splitting it
+    return {"analysis": text, "plan": ""}
+
 # Video analysis with Gemini
+gemini_analyses = asyncio.Semaphore(GEMINI_MAX_ANALYSES)
+
 async def analyze_video_with_gemini(video_path: str, character_image_path: Optional[str] = None, audio_path: Optional[str] = None) -> Dict[str, Any]:
-    """Analyze video using Gemini - try official library first, then fallback to emergentintegrations, then text-only"""
+    """Analyze video using Gemini, queueing once the concurrent-analysis cap is reached"""
+    # Caps whole analyses (file uploads and retries included), on top of the per-call gemini_slot
+    async with gemini_analyses:
+        return await analyze_video_with_fallbacks(video_path, character_image_path, audio_path)
+
+async def analyze_video_with_fallbacks(video_path: str, character_image_path: Optional[str] = None, audio_path: Optional[str] = None) -> Dict[str, Any]:
+    """Analyze video using Gemini - try the JSON-mode models first, then a free-form fallback model, then text-only"""
     try:
-        # First try with official Google Generative AI library
-        logger.info("Attempting video analysis with official Google Generative AI library...")
+        # First try with the official Google Gen AI SDK
+        logger.info("Attempting video analysis with official Google Gen AI SDK...")
         return await analyze_video_with_official_gemini(video_path, character_image_path, audio_path)
         
     except Exception as official_error:
         logger.warning(f"Official Gemini library failed: {str(official_error)}")
-        logger.info("Falling back to emergentintegrations library...")
+        logger.info("Falling back to free-form Gemini analysis...")
         
-        # Fallback to emergentintegrations library
+        # Fallback to a free-form prompt on a different model
+        gemini_key = None
         try:
             gemini_key = get_next_gemini_key()
             
-            # Initialize Gemini chat - Use stable models with free tier availability
-            chat = LlmChat(
-                api_key=gemini_key,
-                session_id=f"video_analysis_{uuid.uuid4()}",
-                system_message="""You are an expert video analyst. Analyze the provided video in extreme detail including:
-                1. Visual content: scenes, objects, people, actions, movements, colors, lighting
-                2. Audio content: speech, music, sound effects, tone, mood
-                3. Narrative structure: beginning, middle, end, story progression
-                4. Style and aesthetics: camera angles, transitions, effects, filters
-                5. Technical aspects: resolution, frame rate, duration, aspect ratio
-                6. Overall theme and message
-                
-                Then create a detailed plan for generating a similar video with the same style, theme, and structure but with different content to avoid direct copying."""
-            ).with_model("gemini", "gemini-2.5-flash-preview-04-17")
+            # Files already uploaded under this key are reused from the Files API
+            # cache, so the bytes aren't read or sent again
+            file_paths = [path for path in (video_path, character_image_path, audio_path) if path]
+            files_to_upload = await ensure_gemini_files(gemini_key, file_paths)
             
-            # Prepare files for analysis
-            file_contents = []
-            
-            # Add video file
-            video_file = FileContentWithMimeType(
-                file_path=video_path,
-                mime_type="video/mp4"
-            )
-            file_contents.append(video_file)
-            
-            # Add character image if provided
-            if character_image_path:
-                image_file = FileContentWithMimeType(
-                    file_path=character_image_path,
-                    mime_type="image/jpeg"
-                )
-                file_contents.append(image_file)
-            
-            # Add audio file if provided
-            if audio_path:
-                audio_file = FileContentWithMimeType(
-                    file_path=audio_path,
-                    mime_type="audio/mpeg"
+            async with gemini_slot(gemini_key):
+                reply = await gemini_clients[gemini_key].aio.models.generate_content(
+                    model='gemini-2.5-flash-preview-04-17',
+                    contents=[VIDEO_ANALYSIS_PROMPT] + files_to_upload,
+                    config={"system_instruction": VIDEO_ANALYST_INSTRUCTION}
                 )
-                file_contents.append(audio_file)
+            response = reply.text
+            gemini_keys.mark_success(gemini_key)
             
-            # Send analysis request
-            message = UserMessage(
-                text="""Please analyze this video in extreme detail. Include:
-                1. Complete visual analysis (scenes, objects, people, actions, camera work)
-                2. Audio analysis (speech, music, sound effects, mood)
-                3. Narrative structure and flow
-                4. Technical specifications
-                5. Overall style and theme
-                
-                Then create a comprehensive plan for generating a similar video with:
-                - Same style and aesthetic approach
-                - Similar narrative structure
-                - Same technical specifications (9:16 aspect ratio, under 60 seconds)
-                - Different content to avoid copying
-                - Specific shot-by-shot breakdown
-                - Audio requirements
-                - Character requirements if applicable
-                
-                Format your response as JSON with 'analysis' and 'plan' fields.""",
-                file_contents=file_contents
-            )
-            
-            response = await chat.send_message(message)
-            
-            # Parse response
-            try:
-                # Try to parse as JSON first
-                result = json.loads(response)
-                return result
-            except json.JSONDecodeError:
-                # If not JSON, create structured response
-                return {
-                    "analysis": response[:len(response)//2],
-                    "plan": response[len(response)//2:]
-                }
+            return extract_analysis_json(response)
                 
         except Exception as fallback_error:
-            logger.warning(f"Emergentintegrations library also failed: {str(fallback_error)}")
+            gemini_keys.mark_failure(gemini_key, fallback_error)
+            logger.warning(f"Fallback Gemini analysis also failed: {str(fallback_error)}")
             logger.info("Falling back to text-only analysis...")
             
             # Final fallback to text-only analysis
             try:
                 return await analyze_video_text_only(video_path, character_image_path, audio_path)
             except Exception as text_error:
-                logger.error(f"All three approaches failed - Official: {str(official_error)} | Emergentintegrations: {str(fallback_error)} | Text-only: {str(text_error)}")
-                raise HTTPException(status_code=500, detail=f"Video analysis failed with all approaches: Official library: {str(official_error)[:200]} | Emergentintegrations: {str(fallback_error)[:200]} | Text-only: {str(text_error)[:200]}")
+                logger.error(f"All three approaches failed - Official: {str(official_error)} | Fallback: {str(fallback_error)} | Text-only: {str(text_error)}")
+                raise HTTPException(status_code=500, detail=f"Video analysis failed with all approaches: Official library: {str(official_error)[:200]} | Fallback: {str(fallback_error)[:200]} | Text-only: {str(text_error)[:200]}")
 
 # Background task for video generation
 async def generate_video_background(session_id: str, plan: str):
     """Background task for video generation using WAN 2.1"""
     try:
-        # Update status to processing
-        await db.video_generations.update_one(
-            {"session_id": session_id},
-            {"$set": {
-                "status": "processing", 
-                "progress": 10,
-                "estimated_time_remaining": 300  # 5 minutes
-            }}
-        )
-        
         # Parse the plan to extract video generation parameters
-        plan_data = json.loads(plan) if isinstance(plan, str) else plan
+        plan_data = orjson.loads(plan) if isinstance(plan, str) else plan
         
         # Get user's uploaded files
         user_record = await db.users.find_one({"session_id": session_id})
         if not user_record:
             raise Exception("User session not found")
         
-        # Initialize WAN 2.1 video generation
+        # Initialize WAN 2.1 video generation; the plan and user lookups take
+        # milliseconds, so this is the first status write for the job
         await db.video_generations.update_one(
             {"session_id": session_id},
             {"$set": {
@@ -461,9 +774,7 @@ async def generate_video_background(session_id: str, plan: str):
                 session_id=session_id,
                 plan=plan_data,
                 user_record=user_record,
-                update_progress=lambda progress, time_remaining: update_generation_progress(
-                    session_id, progress, time_remaining
-                )
+                update_progress=GenerationProgress(session_id).update
             )
             
             # Upload generated video to R2
@@ -505,15 +816,43 @@ async def generate_video_background(session_id: str, plan: str):
             }}
         )
 
-async def update_generation_progress(session_id: str, progress: int, time_remaining: int):
-    """Helper function to update generation progress"""
-    await db.video_generations.update_one(
-        {"session_id": session_id},
-        {"$set": {
-            "progress": progress,
-            "estimated_time_remaining": time_remaining
-        }}
-    )
+PROGRESS_MIN_DELTA = 5
+PROGRESS_MIN_INTERVAL_SECONDS = 2.0
+progress_writes = db.video_generations.with_options(write_concern=WriteConcern(w=0))
+
+class GenerationProgress:
+    """Coalesces progress ticks for one generation, only writing meaningful changes to MongoDB"""
+    
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.written_progress: Optional[int] = None
+        self.written_at = 0.0
+    
+    async def update(self, progress: int, time_remaining: int):
+        # Skipped ticks are superseded by the next write (a later tick or the final status)
+        now = time.monotonic()
+        if (
+            self.written_progress is not None
+            and progress - self.written_progress < PROGRESS_MIN_DELTA
+            and now - self.written_at < PROGRESS_MIN_INTERVAL_SECONDS
+        ):
+            return
+        
+        # Ticks are fire-and-forget; the filter keeps a late tick from moving progress
+        # backwards or touching a generation that has already finished
+        await progress_writes.update_one(
+            {
+                "session_id": self.session_id,
+                "status": {"$nin": list(GENERATION_FINAL_STATUSES)},
+                "progress": {"$lt": progress}
+            },
+            {"$set": {
+                "progress": progress,
+                "estimated_time_remaining": time_remaining
+            }}
+        )
+        self.written_progress = progress
+        self.written_at = now
 
 async def generate_video_with_wan21(session_id: str, plan: dict, user_record: dict, update_progress):
     """Server-side video generation using WAN 2.1"""
@@ -647,7 +986,7 @@ async def combine_video_clips(clip_paths: list, output_path: str):
     
     finally:
         # Clean up
-        os.unlink(concat_file)
+        Path(concat_file).unlink(missing_ok=True)
 
 # API Routes
 @api_router.post("/upload-video", response_model=VideoAnalysisResponse)
@@ -659,92 +998,204 @@ async def upload_video(
     user_id: str = Form(...)
 ):
     """Upload video and optional files for analysis"""
+    paths = {}
     try:
-        session_id = str(uuid.uuid4())
+        # Fail before any validation, disk, R2 or Gemini work if storage is down
+        await require_bucket()
+        session_id = next_uuid()
         
-        # Validate video file
-        if not video_file.content_type.startswith('video/'):
-            raise HTTPException(status_code=400, detail="Invalid video file type")
+        # Validate uploaded files before doing any disk, R2 or Gemini I/O
+        await validate_upload(video_file, "video", MAX_VIDEO_BYTES)
+        if character_image:
+            await validate_upload(character_image, "image", MAX_IMAGE_BYTES)
+        if audio_file:
+            await validate_upload(audio_file, "audio", MAX_AUDIO_BYTES)
+        
+        files = {"video": video_file, "character_image": character_image, "audio": audio_file}
+        uploads = {name: target for name, target in upload_targets(session_id).items() if files[name]}
+        
+        # Save local copies for Gemini, all files concurrently
+        saved = await asyncio.gather(*[
+            save_uploaded_file(files[name], filename)
+            for name, (filename, _) in uploads.items()
+        ])
+        paths = dict(zip(uploads, saved))
+        
+        # R2 uploads read the spooled uploads while Gemini reads the local copies,
+        # so the analysis runs alongside the uploads instead of after them
+        results = await asyncio.gather(
+            *[stream_to_r2(files[name], key) for name, (_, key) in uploads.items()],
+            analyze_video_with_gemini(paths["video"], paths.get("character_image"), paths.get("audio")),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        *r2_urls, analysis_result = results
+        r2_urls = dict(zip(uploads, r2_urls))
         
-        # Save uploaded files
-        video_filename = f"{session_id}_sample.mp4"
-        video_path = await save_uploaded_file(video_file, video_filename)
+        # Create analysis record
+        analysis_record = {
+            "id": next_uuid(),
+            "user_id": user_id,
+            "session_id": session_id,
+            "analysis": analysis_result.get("analysis", ""),
+            "plan": analysis_result.get("plan", ""),
+            "status": "analyzed",
+            "created_at": datetime.utcnow(),
+            "sample_video_path": r2_urls["video"],
+            "character_image_path": r2_urls.get("character_image"),
+            "audio_path": r2_urls.get("audio")
+        }
         
-        character_image_path = None
-        if character_image:
-            if not character_image.content_type.startswith('image/'):
-                raise HTTPException(status_code=400, detail="Invalid image file type")
-            char_filename = f"{session_id}_character.jpg"
-            character_image_path = await save_uploaded_file(character_image, char_filename)
+        await db.video_analyses.insert_one(analysis_record)
         
-        audio_path = None
-        if audio_file:
-            if not audio_file.content_type.startswith('audio/'):
-                raise HTTPException(status_code=400, detail="Invalid audio file type")
-            audio_filename = f"{session_id}_audio.mp3"
-            audio_path = await save_uploaded_file(audio_file, audio_filename)
+        # Delete the temporary copies after the response has been sent
+        background_tasks.add_task(remove_temp_files, list(paths.values()))
+        paths = {}
         
-        # Upload to R2 storage
-        r2_video_url = await upload_to_r2(video_path, f"samples/{video_filename}")
+        # The record was built above from trusted values, so skip re-validation;
+        # a direct response also bypasses FastAPI's response_model pass
+        return ORJSONResponse(VideoAnalysisResponse.model_construct(**analysis_record).model_dump())
         
-        r2_image_url = None
-        if character_image_path:
-            r2_image_url = await upload_to_r2(character_image_path, f"characters/{char_filename}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Video upload failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Failed requests clean up here; successful ones handed cleanup to a background task
+        await remove_temp_files(list(paths.values()))
+
+@api_router.post("/presign-upload", response_model=PresignUploadResponse)
+async def presign_upload(request: PresignUploadRequest):
+    """Allocate a session and return presigned URLs for uploading straight to R2"""
+    try:
+        content_types = {
+            "video": request.video_content_type,
+            "character_image": request.character_image_content_type,
+            "audio": request.audio_content_type
+        }
+        media_types = {"video": "video", "character_image": "image", "audio": "audio"}
+        for name, content_type in content_types.items():
+            if content_type and not content_type.startswith(f"{media_types[name]}/"):
+                raise HTTPException(status_code=400, detail=f"Invalid {media_types[name]} file type")
         
-        r2_audio_url = None
-        if audio_path:
-            r2_audio_url = await upload_to_r2(audio_path, f"audio/{audio_filename}")
+        await require_bucket()
+        session_id = next_uuid()
+        
+        targets = {
+            name: key for name, (_, key) in upload_targets(session_id).items()
+            if content_types[name]
+        }
+        urls = await asyncio.gather(*[
+            presign_r2_put(key, content_types[name]) for name, key in targets.items()
+        ])
+        
+        await db.upload_sessions.insert_one({
+            "session_id": session_id,
+            "user_id": request.user_id,
+            "files": list(targets),
+            "created_at": datetime.utcnow()
+        })
+        
+        return PresignUploadResponse(
+            session_id=session_id,
+            upload_urls=dict(zip(targets, urls)),
+            expires_in=PRESIGNED_URL_EXPIRY_SECONDS
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Presigning upload failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/analyze", response_model=VideoAnalysisResponse)
+async def analyze_uploaded_video(request: AnalyzeUploadRequest, background_tasks: BackgroundTasks):
+    """Analyze files the client uploaded directly to R2"""
+    paths = {}
+    try:
+        upload_session = await db.upload_sessions.find_one({"session_id": request.session_id})
+        if not upload_session:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        
+        session_id = request.session_id
+        limits = {
+            "video": ("video", MAX_VIDEO_BYTES),
+            "character_image": ("image", MAX_IMAGE_BYTES),
+            "audio": ("audio", MAX_AUDIO_BYTES)
+        }
+        targets = {
+            name: target for name, target in upload_targets(session_id).items()
+            if name in upload_session["files"]
+        }
+        
+        # Pull every uploaded file down from R2 concurrently
+        downloads = await asyncio.gather(*[
+            download_from_r2(key, filename, *limits[name])
+            for name, (filename, key) in targets.items()
+        ], return_exceptions=True)
+        paths = {
+            name: path for name, path in zip(targets, downloads)
+            if not isinstance(path, BaseException)
+        }
+        for result in downloads:
+            if isinstance(result, BaseException):
+                raise result
         
-        # Analyze video with Gemini
         analysis_result = await analyze_video_with_gemini(
-            video_path, character_image_path, audio_path
+            paths["video"], paths.get("character_image"), paths.get("audio")
         )
         
-        # Create analysis record
         analysis_record = {
-            "id": str(uuid.uuid4()),
-            "user_id": user_id,
+            "id": next_uuid(),
+            "user_id": upload_session["user_id"],
             "session_id": session_id,
             "analysis": analysis_result.get("analysis", ""),
             "plan": analysis_result.get("plan", ""),
             "status": "analyzed",
             "created_at": datetime.utcnow(),
-            "sample_video_path": r2_video_url,
-            "character_image_path": r2_image_url,
-            "audio_path": r2_audio_url
+            "sample_video_path": get_r2_url(targets["video"][1]),
+            "character_image_path": get_r2_url(targets["character_image"][1]) if "character_image" in targets else None,
+            "audio_path": get_r2_url(targets["audio"][1]) if "audio" in targets else None
         }
         
-        await db.video_analyses.insert_one(analysis_record)
+        # Independent collections, so both writes share one round-trip of latency
+        await asyncio.gather(
+            db.video_analyses.insert_one(analysis_record),
+            db.upload_sessions.delete_one({"session_id": session_id})
+        )
         
-        # Clean up temporary files
-        if os.path.exists(video_path):
-            os.remove(video_path)
-        if character_image_path and os.path.exists(character_image_path):
-            os.remove(character_image_path)
-        if audio_path and os.path.exists(audio_path):
-            os.remove(audio_path)
+        background_tasks.add_task(remove_temp_files, list(paths.values()))
+        paths = {}
         
-        return VideoAnalysisResponse(**analysis_record)
+        return ORJSONResponse(VideoAnalysisResponse.model_construct(**analysis_record).model_dump())
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Video upload failed: {str(e)}")
+        logger.error(f"Analysis of uploaded video failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await remove_temp_files(list(paths.values()))
 
 @api_router.post("/modify-plan")
 async def modify_plan(request: PlanModificationRequest):
     """Modify the generated plan based on user feedback"""
+    gemini_key = None
     try:
         # Get current analysis
-        analysis = await db.video_analyses.find_one({"session_id": request.session_id})
+        analysis = await db.video_analyses.find_one(
+            {"session_id": request.session_id},
+            {"_id": 0, "plan": 1, "analysis": 1}
+        )
         if not analysis:
             raise HTTPException(status_code=404, detail="Analysis not found")
         
         # Use stable Gemini model for plan modification
         gemini_key = get_next_gemini_key()
-        chat = LlmChat(
-            api_key=gemini_key,
-            session_id=f"plan_modification_{uuid.uuid4()}",
-            system_message=f"""You are a video generation expert. The user has requested modifications to this plan:
+        system_instruction = f"""You are a video generation expert. The user has requested modifications to this plan:
             
             ORIGINAL PLAN:
             {analysis['plan']}
@@ -753,13 +1204,17 @@ async def modify_plan(request: PlanModificationRequest):
             {analysis['analysis']}
             
             Please modify the plan based on the user's request while maintaining the same structure and format."""
-        ).with_model("gemini", "gemini-2.5-flash-preview-04-17")
-        
-        message = UserMessage(
-            text=f"Please modify the video generation plan based on this request: {request.modification_request}"
-        )
         
-        modified_plan = await chat.send_message(message)
+        # The per-key client keeps its connections pooled between calls; a fresh
+        # LlmChat per request would open (and TLS-handshake) a new one every time
+        async with gemini_slot(gemini_key):
+            response = await gemini_clients[gemini_key].aio.models.generate_content(
+                model='gemini-2.5-flash-preview-04-17',
+                contents=f"Please modify the video generation plan based on this request: {request.modification_request}",
+                config={"system_instruction": system_instruction}
+            )
+        modified_plan = response.text
+        gemini_keys.mark_success(gemini_key)
         
         # Update the analysis record
         await db.video_analyses.update_one(
@@ -773,6 +1228,7 @@ async def modify_plan(request: PlanModificationRequest):
         return {"status": "success", "modified_plan": modified_plan}
         
     except Exception as e:
+        gemini_keys.mark_failure(gemini_key, e)
         logger.error(f"Plan modification failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -790,7 +1246,12 @@ async def generate_video(request: VideoGenerationRequest, background_tasks: Back
             "estimated_time_remaining": 300
         }
         
-        await db.video_generations.insert_one(generation_record)
+        # One generation per session; restarting replaces the previous attempt
+        await db.video_generations.replace_one(
+            {"session_id": request.session_id},
+            generation_record,
+            upsert=True
+        )
         
         # Start background generation task
         background_tasks.add_task(generate_video_background, request.session_id, request.approved_plan)
@@ -805,43 +1266,126 @@ async def generate_video(request: VideoGenerationRequest, background_tasks: Back
 async def get_generation_status(session_id: str):
     """Get video generation status"""
     try:
-        generation = await db.video_generations.find_one({"session_id": session_id})
+        generation = await db.video_generations.find_one({"session_id": session_id}, GENERATION_STATUS_PROJECTION)
         if not generation:
             raise HTTPException(status_code=404, detail="Generation not found")
         
-        return VideoGenerationStatus(
-            session_id=generation["session_id"],
-            status=generation["status"],
-            progress=generation.get("progress", 0),
-            estimated_time_remaining=generation.get("estimated_time_remaining"),
-            error=generation.get("error")
-        )
+        # Hand orjson the plain dict rather than letting FastAPI re-encode the model
+        return ORJSONResponse(build_generation_status(generation).model_dump())
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Status check failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def watch_generation(session_id: str):
+    """Yield a generation's status now and again after every write, until it finishes"""
+    # Open the change stream before reading the current state so no update is missed.
+    # Change streams need a replica set; clients fall back to polling if the stream errors.
+    pipeline = [
+        {"$match": {
+            "fullDocument.session_id": session_id,
+            "operationType": {"$in": ["insert", "update", "replace"]}
+        }},
+        # Don't ship the approved plan with every progress event
+        {"$project": {f"fullDocument.{field}": 1 for field in GENERATION_STATUS_PROJECTION}}
+    ]
+    async with db.video_generations.watch(pipeline, full_document="updateLookup") as stream:
+        generation = await db.video_generations.find_one({"session_id": session_id}, GENERATION_STATUS_PROJECTION)
+        if not generation:
+            return
+        
+        status = build_generation_status(generation)
+        yield status
+        
+        while status.status not in GENERATION_FINAL_STATUSES:
+            change = await stream.next()
+            if not change.get("fullDocument"):
+                continue
+            status = build_generation_status(change["fullDocument"])
+            yield status
+
+@api_router.websocket("/ws/generation-status/{session_id}")
+async def watch_generation_status(websocket: WebSocket, session_id: str):
+    """Push video generation status updates as they are written, instead of polling"""
+    await websocket.accept()
+    try:
+        found = False
+        async for status in watch_generation(session_id):
+            found = True
+            await websocket.send_text(orjson.dumps(status.model_dump()).decode())
+        
+        if not found:
+            await websocket.close(code=4404, reason="Generation not found")
+            return
+        
+        await websocket.close()
+        
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Status stream failed: {str(e)}")
+        await websocket.close(code=1011)
+
+@api_router.get("/generation-status-stream/{session_id}")
+async def stream_generation_status(session_id: str):
+    """Stream video generation status updates as server-sent events"""
+    if not await db.video_generations.find_one({"session_id": session_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Generation not found")
+    
+    async def events():
+        try:
+            async for status in watch_generation(session_id):
+                yield b"data: " + orjson.dumps(status.model_dump()) + b"\n\n"
+        except Exception as e:
+            logger.error(f"Status stream failed: {str(e)}")
+            yield b"event: error\ndata: " + orjson.dumps({"detail": str(e)}) + b"\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @api_router.get("/user-videos/{user_id}")
 async def get_user_videos(user_id: str):
     """Get all videos for a user"""
     try:
-        # Get all analyses for the user
-        analyses = await db.video_analyses.find({"user_id": user_id}).sort("created_at", -1).to_list(100)
-        
-        # Get generation status for each
-        result = []
-        for analysis in analyses:
-            generation = await db.video_generations.find_one({"session_id": analysis["session_id"]})
-            
-            video_info = {
-                "session_id": analysis["session_id"],
-                "created_at": analysis["created_at"],
-                "analysis": analysis["analysis"][:200] + "..." if len(analysis["analysis"]) > 200 else analysis["analysis"],
-                "status": generation["status"] if generation else "analyzed",
-                "progress": generation.get("progress", 0) if generation else 0,
-                "video_url": generation.get("video_url") if generation else None
-            }
-            result.append(video_info)
+        # Get the user's analyses joined with their generation status in one round-trip
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {"$sort": {"created_at": -1}},
+            {"$limit": 100},
+            # Only pull the status fields, not the generation's full approved plan
+            {"$lookup": {
+                "from": "video_generations",
+                "let": {"session_id": "$session_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$session_id", "$$session_id"]}}},
+                    {"$limit": 1},
+                    {"$project": {"_id": 0, "status": 1, "progress": 1, "video_url": 1}}
+                ],
+                "as": "generation"
+            }},
+            {"$unwind": {"path": "$generation", "preserveNullAndEmptyArrays": True}},
+            {"$addFields": {"analysis": {"$ifNull": ["$analysis", ""]}}},
+            {"$project": {
+                "_id": 0,
+                "session_id": 1,
+                "created_at": 1,
+                # Truncate in the database so only the preview crosses the wire
+                "analysis": {"$cond": [
+                    {"$gt": [{"$strLenCP": "$analysis"}, 200]},
+                    {"$concat": [{"$substrCP": ["$analysis", 0, 200]}, "..."]},
+                    "$analysis"
+                ]},
+                "status": {"$ifNull": ["$generation.status", "analyzed"]},
+                "progress": {"$ifNull": ["$generation.progress", 0]},
+                "video_url": {"$ifNull": ["$generation.video_url", None]}
+            }}
+        ]
+        result = await db.video_analyses.aggregate(pipeline).to_list(100)
         
         return {"videos": result}
         
@@ -860,7 +1404,12 @@ async def create_user(email: str = Form(...)):
         
         # Create new user
         user = User(email=email)
-        await db.users.insert_one(user.dict())
+        try:
+            await db.users.insert_one(user.model_dump())
+        except DuplicateKeyError:
+            # A concurrent request registered the same email first
+            existing_user = await db.users.find_one({"email": email})
+            return {"user_id": existing_user["id"], "message": "User already exists"}
         
         return {"user_id": user.id, "message": "User created successfully"}
         
@@ -872,12 +1421,14 @@ async def create_user(email: str = Form(...)):
 async def get_analysis(session_id: str):
     """Get analysis details for a session"""
     try:
-        analysis = await db.video_analyses.find_one({"session_id": session_id})
+        analysis = await db.video_analyses.find_one({"session_id": session_id}, {"_id": 0})
         if not analysis:
             raise HTTPException(status_code=404, detail="Analysis not found")
         
         return analysis
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Analysis fetch failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -885,18 +1436,55 @@ async def get_analysis(session_id: str):
 # Include the router in the main app
 app.include_router(api_router)
 
+# Concrete lists let the middleware build its preflight headers once;
+# set CORS_ORIGINS (comma-separated) to lock origins down per deployment
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=[origin.strip() for origin in os.environ.get('CORS_ORIGINS', '*').split(',')],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Authorization", "Content-Type"],
 )
 
+@app.on_event("startup")
+async def open_r2_client():
+    # One client for the app's lifetime keeps its connection pool warm across requests
+    app.state.r2_exit_stack = AsyncExitStack()
+    app.state.r2 = await app.state.r2_exit_stack.enter_async_context(r2_session.client(
+        's3',
+        endpoint_url=os.environ.get('CLOUDFLARE_API_ENDPOINT'),
+        config=AioConfig(signature_version='s3v4', max_pool_connections=50)
+    ))
+    app.state.bucket_ready = False
+    try:
+        await ensure_bucket()
+    except Exception as e:
+        # Uploads surface their own R2 errors, so a transient outage shouldn't block startup
+        logger.error(f"R2 bucket check failed at startup: {str(e)}")
+
+@app.on_event("startup")
+async def create_indexes():
+    indexes = [
+        ("video_analyses.session_id", db.video_analyses.create_index("session_id", unique=True)),
+        # Also serves plain user_id lookups through its prefix
+        ("video_analyses.user_id_created_at", db.video_analyses.create_index([("user_id", 1), ("created_at", -1)])),
+        ("video_generations.session_id", db.video_generations.create_index("session_id", unique=True)),
+        ("users.email", db.users.create_index("email", unique=True)),
+        ("upload_sessions.session_id", db.upload_sessions.create_index("session_id", unique=True)),
+        ("upload_sessions.created_at", db.upload_sessions.create_index("created_at", expireAfterSeconds=UPLOAD_SESSION_TTL_SECONDS))
+    ]
+    # Index builds are independent, so issue them together; one failure doesn't sink the rest
+    results = await asyncio.gather(*(build for _, build in indexes), return_exceptions=True)
+    for (name, _), result in zip(indexes, results):
+        if isinstance(result, Exception):
+            logger.error(f"MongoDB index creation failed for {name}: {str(result)}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    await app.state.r2_exit_stack.aclose()
+    log_listener.stop()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -4,12 +4,15 @@ Comprehensive Backend API Test Suite
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import os
+import threading
 import tempfile
 import time
 from dotenv import load_dotenv
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables
 load_dotenv('/app/frontend/.env')
@@ -22,32 +25,56 @@ print(f"Testing backend at: {API_BASE_URL}")
 
 class ComprehensiveBackendTester:
     def __init__(self):
+        # One pooled session for every test, so calls reuse a kept-alive connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         self.test_user_id = None
         self.test_session_id = None
+        self._local = threading.local()  # the running test's output lines
+        self._print_lock = threading.Lock()
         
+    def log(self, message=""):
+        lines = getattr(self._local, 'lines', None)
+        if lines is None:
+            print(message)
+        else:
+            lines.append(message)
+    
+    def run_buffered(self, test):
+        """Run a test, then print all of its lines together"""
+        self._local.lines = []
+        try:
+            return test()
+        finally:
+            with self._print_lock:
+                print("\n".join(self._local.lines), flush=True)
+            self._local.lines = None
+    
     def test_user_registration(self):
         """Test user registration and duplicate handling"""
-        print("\n=== Testing User Registration ===")
+        self.log("\n=== Testing User Registration ===")
         
         try:
             test_email = f"testuser_{uuid.uuid4().hex[:8]}@example.com"
             
             # Test user creation
-            response = requests.post(
+            response = self.session.post(
                 f"{API_BASE_URL}/create-user",
                 data={"email": test_email},
                 timeout=10
             )
             
-            print(f"Status Code: {response.status_code}")
+            self.log(f"Status Code: {response.status_code}")
             
             if response.status_code == 200:
                 data = response.json()
                 self.test_user_id = data.get('user_id')
-                print(f"✅ User created successfully with ID: {self.test_user_id}")
+                self.log(f"✅ User created successfully with ID: {self.test_user_id}")
                 
                 # Test duplicate user creation
-                response2 = requests.post(
+                response2 = self.session.post(
                     f"{API_BASE_URL}/create-user",
                     data={"email": test_email},
                     timeout=10
@@ -56,25 +83,25 @@ class ComprehensiveBackendTester:
                 if response2.status_code == 200:
                     data2 = response2.json()
                     if "already exists" in data2.get('message', ''):
-                        print("✅ Duplicate user handling works correctly")
+                        self.log("✅ Duplicate user handling works correctly")
                     else:
-                        print("⚠️ Duplicate user created new entry")
+                        self.log("⚠️ Duplicate user created new entry")
                 
                 return True
             else:
-                print(f"❌ User creation failed: {response.text}")
+                self.log(f"❌ User creation failed: {response.text}")
                 return False
                 
         except Exception as e:
-            print(f"❌ User registration test failed: {str(e)}")
+            self.log(f"❌ User registration test failed: {str(e)}")
             return False
     
     def test_video_upload_and_analysis(self):
         """Test video upload with Gemini analysis"""
-        print("\n=== Testing Video Upload and Gemini Analysis ===")
+        self.log("\n=== Testing Video Upload and Gemini Analysis ===")
         
         if not self.test_user_id:
-            print("❌ No user ID available")
+            self.log("❌ No user ID available")
             return False
         
         try:
@@ -97,15 +124,15 @@ class ComprehensiveBackendTester:
                     'user_id': self.test_user_id
                 }
                 
-                print("Testing video upload with Gemini analysis...")
-                response = requests.post(
+                self.log("Testing video upload with Gemini analysis...")
+                response = self.session.post(
                     f"{API_BASE_URL}/upload-video",
                     files=files,
                     data=data,
                     timeout=120
                 )
                 
-                print(f"Status Code: {response.status_code}")
+                self.log(f"Status Code: {response.status_code}")
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -113,26 +140,26 @@ class ComprehensiveBackendTester:
                     analysis = data.get('analysis', '')
                     plan = data.get('plan', '')
                     
-                    print(f"✅ Video upload successful with session ID: {self.test_session_id}")
-                    print(f"Analysis length: {len(analysis)}")
-                    print(f"Plan length: {len(plan)}")
-                    print(f"Sample video path: {data.get('sample_video_path', 'N/A')}")
-                    print(f"Character image path: {data.get('character_image_path', 'N/A')}")
+                    self.log(f"✅ Video upload successful with session ID: {self.test_session_id}")
+                    self.log(f"Analysis length: {len(analysis)}")
+                    self.log(f"Plan length: {len(plan)}")
+                    self.log(f"Sample video path: {data.get('sample_video_path', 'N/A')}")
+                    self.log(f"Character image path: {data.get('character_image_path', 'N/A')}")
                     
                     if analysis and plan and len(analysis) > 100 and len(plan) > 100:
-                        print("✅ Detailed analysis and plan generated")
-                        print("✅ Gemini integration working with fallback approach")
+                        self.log("✅ Detailed analysis and plan generated")
+                        self.log("✅ Gemini integration working with fallback approach")
                         return True
                     else:
-                        print("⚠️ Analysis/plan generated but may be incomplete")
+                        self.log("⚠️ Analysis/plan generated but may be incomplete")
                         return True
                         
                 else:
-                    print(f"❌ Video upload failed: {response.text}")
+                    self.log(f"❌ Video upload failed: {response.text}")
                     return False
             
         except Exception as e:
-            print(f"❌ Video upload test failed: {str(e)}")
+            self.log(f"❌ Video upload test failed: {str(e)}")
             return False
         finally:
             try:
@@ -143,47 +170,47 @@ class ComprehensiveBackendTester:
     
     def test_analysis_retrieval(self):
         """Test analysis retrieval endpoint"""
-        print("\n=== Testing Analysis Retrieval ===")
+        self.log("\n=== Testing Analysis Retrieval ===")
         
         if not self.test_session_id:
-            print("❌ No session ID available")
+            self.log("❌ No session ID available")
             return False
         
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{API_BASE_URL}/analysis/{self.test_session_id}",
                 timeout=10
             )
             
-            print(f"Status Code: {response.status_code}")
+            self.log(f"Status Code: {response.status_code}")
             
             if response.status_code == 200:
                 data = response.json()
-                print(f"✅ Analysis retrieval successful")
-                print(f"Analysis length: {len(data.get('analysis', ''))}")
-                print(f"Plan length: {len(data.get('plan', ''))}")
-                print(f"Status: {data.get('status')}")
+                self.log(f"✅ Analysis retrieval successful")
+                self.log(f"Analysis length: {len(data.get('analysis', ''))}")
+                self.log(f"Plan length: {len(data.get('plan', ''))}")
+                self.log(f"Status: {data.get('status')}")
                 return True
             else:
-                print(f"❌ Analysis retrieval failed: {response.text}")
+                self.log(f"❌ Analysis retrieval failed: {response.text}")
                 return False
                 
         except Exception as e:
-            print(f"❌ Analysis retrieval test failed: {str(e)}")
+            self.log(f"❌ Analysis retrieval test failed: {str(e)}")
             return False
     
     def test_plan_modification(self):
         """Test plan modification with chat"""
-        print("\n=== Testing Plan Modification ===")
+        self.log("\n=== Testing Plan Modification ===")
         
         if not self.test_session_id:
-            print("❌ No session ID available")
+            self.log("❌ No session ID available")
             return False
         
         try:
             modification_request = "Make the video more energetic with dynamic camera movements and add more visual effects"
             
-            response = requests.post(
+            response = self.session.post(
                 f"{API_BASE_URL}/modify-plan",
                 json={
                     "session_id": self.test_session_id,
@@ -192,43 +219,43 @@ class ComprehensiveBackendTester:
                 timeout=60
             )
             
-            print(f"Status Code: {response.status_code}")
+            self.log(f"Status Code: {response.status_code}")
             
             if response.status_code == 200:
                 data = response.json()
                 if data.get('status') == 'success' and data.get('modified_plan'):
                     modified_plan = data.get('modified_plan')
-                    print(f"✅ Plan modification successful")
-                    print(f"Modified plan length: {len(modified_plan)}")
+                    self.log(f"✅ Plan modification successful")
+                    self.log(f"Modified plan length: {len(modified_plan)}")
                     
                     if len(modified_plan) > 100:
-                        print("✅ Plan modification working with Gemini chat")
+                        self.log("✅ Plan modification working with Gemini chat")
                         return True
                     else:
-                        print("⚠️ Plan modification response too short")
+                        self.log("⚠️ Plan modification response too short")
                         return False
                 else:
-                    print("⚠️ Plan modification response incomplete")
+                    self.log("⚠️ Plan modification response incomplete")
                     return False
             else:
-                print(f"❌ Plan modification failed: {response.text}")
+                self.log(f"❌ Plan modification failed: {response.text}")
                 return False
                 
         except Exception as e:
-            print(f"❌ Plan modification test failed: {str(e)}")
+            self.log(f"❌ Plan modification test failed: {str(e)}")
             return False
     
     def test_video_generation(self):
         """Test video generation and status tracking"""
-        print("\n=== Testing Video Generation ===")
+        self.log("\n=== Testing Video Generation ===")
         
         if not self.test_session_id:
-            print("❌ No session ID available")
+            self.log("❌ No session ID available")
             return False
         
         try:
             # Start video generation
-            response = requests.post(
+            response = self.session.post(
                 f"{API_BASE_URL}/generate-video",
                 json={
                     "session_id": self.test_session_id,
@@ -237,114 +264,121 @@ class ComprehensiveBackendTester:
                 timeout=15
             )
             
-            print(f"Status Code: {response.status_code}")
+            self.log(f"Status Code: {response.status_code}")
             
             if response.status_code == 200:
                 data = response.json()
                 if data.get('status') == 'success':
-                    print("✅ Video generation started successfully")
+                    self.log("✅ Video generation started successfully")
                     
-                    # Test status tracking
-                    time.sleep(3)
-                    status_response = requests.get(
-                        f"{API_BASE_URL}/generation-status/{self.test_session_id}",
-                        timeout=10
-                    )
+                    # Poll status tracking until it reports a status, for up to 3s
+                    status_url = f"{API_BASE_URL}/generation-status/{self.test_session_id}"
+                    deadline = time.monotonic() + 3.0
+                    status_data = None
+                    while True:
+                        status_response = self.session.get(status_url, timeout=10)
+                        if status_response.status_code == 200:
+                            data = status_response.json()
+                            if data.get('status'):
+                                status_data = data
+                                break
+                        if time.monotonic() + 0.25 >= deadline:
+                            break
+                        time.sleep(0.25)
                     
-                    if status_response.status_code == 200:
-                        status_data = status_response.json()
-                        print(f"Generation Status: {status_data.get('status')}")
-                        print(f"Progress: {status_data.get('progress')}%")
-                        print(f"Estimated time remaining: {status_data.get('estimated_time_remaining')}s")
-                        print("✅ Status tracking working")
+                    if status_data:
+                        self.log(f"Generation Status: {status_data.get('status')}")
+                        self.log(f"Progress: {status_data.get('progress')}%")
+                        self.log(f"Estimated time remaining: {status_data.get('estimated_time_remaining')}s")
+                        self.log("✅ Status tracking working")
                         return True
                     else:
-                        print("⚠️ Status tracking may not be working")
+                        self.log("⚠️ Status tracking may not be working")
                         return False
                 else:
-                    print("⚠️ Video generation response incomplete")
+                    self.log("⚠️ Video generation response incomplete")
                     return False
             else:
-                print(f"❌ Video generation failed: {response.text}")
+                self.log(f"❌ Video generation failed: {response.text}")
                 return False
                 
         except Exception as e:
-            print(f"❌ Video generation test failed: {str(e)}")
+            self.log(f"❌ Video generation test failed: {str(e)}")
             return False
     
     def test_user_videos(self):
         """Test user video management"""
-        print("\n=== Testing User Video Management ===")
+        self.log("\n=== Testing User Video Management ===")
         
         if not self.test_user_id:
-            print("❌ No user ID available")
+            self.log("❌ No user ID available")
             return False
         
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{API_BASE_URL}/user-videos/{self.test_user_id}",
                 timeout=10
             )
             
-            print(f"Status Code: {response.status_code}")
+            self.log(f"Status Code: {response.status_code}")
             
             if response.status_code == 200:
                 data = response.json()
                 videos = data.get('videos', [])
                 
                 if isinstance(videos, list):
-                    print(f"✅ User videos endpoint working - found {len(videos)} videos")
+                    self.log(f"✅ User videos endpoint working - found {len(videos)} videos")
                     
                     if videos:
                         video = videos[0]
-                        print(f"Sample video info:")
-                        print(f"  Session ID: {video.get('session_id')}")
-                        print(f"  Status: {video.get('status')}")
-                        print(f"  Progress: {video.get('progress')}%")
-                        print(f"  Created: {video.get('created_at')}")
+                        self.log(f"Sample video info:")
+                        self.log(f"  Session ID: {video.get('session_id')}")
+                        self.log(f"  Status: {video.get('status')}")
+                        self.log(f"  Progress: {video.get('progress')}%")
+                        self.log(f"  Created: {video.get('created_at')}")
                     
                     return True
                 else:
-                    print("⚠️ User videos response format incorrect")
+                    self.log("⚠️ User videos response format incorrect")
                     return False
             else:
-                print(f"❌ User videos failed: {response.text}")
+                self.log(f"❌ User videos failed: {response.text}")
                 return False
                 
         except Exception as e:
-            print(f"❌ User videos test failed: {str(e)}")
+            self.log(f"❌ User videos test failed: {str(e)}")
             return False
     
     def test_error_handling(self):
         """Test error handling for various scenarios"""
-        print("\n=== Testing Error Handling ===")
+        self.log("\n=== Testing Error Handling ===")
         
         try:
             # Test upload without video file
-            response = requests.post(
+            response = self.session.post(
                 f"{API_BASE_URL}/upload-video",
                 data={"user_id": "test_user"},
                 timeout=10
             )
             
             if response.status_code == 422:  # FastAPI validation error
-                print("✅ Error handling for missing video file works")
+                self.log("✅ Error handling for missing video file works")
             else:
-                print(f"⚠️ Unexpected response for missing file: {response.status_code}")
+                self.log(f"⚠️ Unexpected response for missing file: {response.status_code}")
             
             # Test invalid session ID
-            response = requests.get(
+            response = self.session.get(
                 f"{API_BASE_URL}/analysis/invalid_session_id",
                 timeout=10
             )
             
             if response.status_code == 404:
-                print("✅ Error handling for invalid session ID works")
+                self.log("✅ Error handling for invalid session ID works")
             else:
-                print(f"⚠️ Unexpected response for invalid session: {response.status_code}")
+                self.log(f"⚠️ Unexpected response for invalid session: {response.status_code}")
             
             # Test plan modification with invalid session
-            response = requests.post(
+            response = self.session.post(
                 f"{API_BASE_URL}/modify-plan",
                 json={
                     "session_id": "invalid_session",
@@ -354,14 +388,14 @@ class ComprehensiveBackendTester:
             )
             
             if response.status_code == 404:
-                print("✅ Error handling for invalid plan modification works")
+                self.log("✅ Error handling for invalid plan modification works")
             else:
-                print(f"⚠️ Unexpected response for invalid plan modification: {response.status_code}")
+                self.log(f"⚠️ Unexpected response for invalid plan modification: {response.status_code}")
             
             return True
             
         except Exception as e:
-            print(f"❌ Error handling test failed: {str(e)}")
+            self.log(f"❌ Error handling test failed: {str(e)}")
             return False
     
     def run_comprehensive_tests(self):
@@ -371,14 +405,26 @@ class ComprehensiveBackendTester:
         
         results = {}
         
-        # Run all tests
-        results['user_registration'] = self.test_user_registration()
-        results['video_upload_analysis'] = self.test_video_upload_and_analysis()
-        results['analysis_retrieval'] = self.test_analysis_retrieval()
-        results['plan_modification'] = self.test_plan_modification()
-        results['video_generation'] = self.test_video_generation()
-        results['user_videos'] = self.test_user_videos()
-        results['error_handling'] = self.test_error_handling()
+        # Only registration -> upload -> session tests form a chain; error handling
+        # runs alongside it and the session tests run together once upload is done
+        try:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                error_handling = executor.submit(self.run_buffered, self.test_error_handling)
+                
+                results['user_registration'] = self.run_buffered(self.test_user_registration)
+                results['video_upload_analysis'] = self.run_buffered(self.test_video_upload_and_analysis)
+                
+                futures = {
+                    'analysis_retrieval': executor.submit(self.run_buffered, self.test_analysis_retrieval),
+                    'plan_modification': executor.submit(self.run_buffered, self.test_plan_modification),
+                    'video_generation': executor.submit(self.run_buffered, self.test_video_generation),
+                    'user_videos': executor.submit(self.run_buffered, self.test_user_videos),
+                    'error_handling': error_handling,
+                }
+                for name, future in futures.items():
+                    results[name] = future.result()
+        finally:
+            self.session.close()
         
         # Summary
         print("\n" + "=" * 80)